@@ -461,32 +461,11 @@
           echo "✅ Smart regeneration complete!"
         '';
 
-        # Build WASM package
+        # Build WASM package; runs scripts/build-wasm.sh so both entry points
+        # share one build (see the script header for its environment switches)
         build-wasm = pkgs.writeShellScriptBin "build-wasm" ''
-          set -euo pipefail
-          
-          echo "🔧 Building Amalgam WASM bindings..."
-          echo ""
-          
-          cd crates/amalgam-wasm
-          
-          # Build for different targets
-          echo "📦 Building for bundler target (webpack/rollup)..."
-          ${pkgs.wasm-pack}/bin/wasm-pack build --target bundler --out-dir pkg-bundler
-          
-          echo "📦 Building for web target (direct browser use)..."
-          ${pkgs.wasm-pack}/bin/wasm-pack build --target web --out-dir pkg-web
-          
-          echo "📦 Building for nodejs target..."
-          ${pkgs.wasm-pack}/bin/wasm-pack build --target nodejs --out-dir pkg-node
-          
-          echo ""
-          echo "✅ WASM build complete!"
-          echo ""
-          echo "Packages created:"
-          echo "  • pkg-bundler/ - For webpack/rollup bundlers"
-          echo "  • pkg-web/     - For direct browser usage"  
-          echo "  • pkg-node/    - For Node.js applications"
+          export PATH=${pkgs.lib.makeBinPath [ rustWithWasm pkgs.wasm-pack pkgs.binaryen ]}:$PATH
+          exec ${pkgs.bash}/bin/bash ${./scripts/build-wasm.sh} "$@"
         '';
         
         # Custom source filter that includes test fixtures
@@ -10,17 +10,47 @@ This tool helps with:
 """
 
 import argparse
+import hashlib
 import json
 import os
 import subprocess
 import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 import shutil
 import re
 
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
+
+
+# 'Path dependency; the package name is the last component of the path
+_PATH_DEP_RE = re.compile(r"'Path\s+\"(?:[^\"]*/)?(?P<name>[^/\"]+)/?\"")
+
+# Literal fields of an Amalgam-generated Nickel-pkg.ncl
+_MANIFEST_NAME_RE = re.compile(r'^\s*name\s*=\s*"([^"]+)"', re.MULTILINE)
+_MANIFEST_VERSION_RE = re.compile(r'^\s*version\s*=\s*"([^"]+)"', re.MULTILINE)
+_MANIFEST_DEPS_RE = re.compile(r'^\s*dependencies\s*=\s*\{([^}]*)\}', re.MULTILINE)
+_MANIFEST_DEP_ENTRY_RE = re.compile(r'^\s*([\w-]+)\s*=\s*(.+?),?\s*$', re.MULTILINE)
+_MANIFEST_DYNAMIC_RE = re.compile(r'\bimport\b|\blet\b|%\{')
+_MANIFEST_COMMENT_RE = re.compile(r'^\s*#.*$', re.MULTILINE)
+# The generated shape: one record literal, optionally checked against the
+# package contract. Merges (&) and other contracts (|) need nickel
+_MANIFEST_SHAPE_RE = re.compile(
+    r'\A\s*\{(?P<body>[^&|]*)\}\s*(?:\|\s*std\.package\.Manifest\s*)?\Z', re.DOTALL
+)
+
+# Maximum number of files passed to a single `nickel typecheck`
+_TYPECHECK_BATCH_SIZE = 32
+
+# Directories that never contain package sources
+_SKIP_DIRS = frozenset({".git", "target", "result", "node_modules", ".direnv"})
+
 
 @dataclass
 class PackageInfo:
@@ -48,6 +78,10 @@ class PackageManager:
         self.workspace_root = workspace_root
         self.packages_dir = workspace_root / "examples" / "pkgs"
         self.nickel_bin = self._find_nickel()
+        self._packages_cache: Optional[List[PackageInfo]] = None
+        self._pkg_by_name: Dict[str, PackageInfo] = {}
+        cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        self.typecheck_cache_path = Path(cache_home) / "amalgam" / "typecheck.json"
         
     def _find_nickel(self) -> str:
         """Find the nickel binary."""
@@ -57,66 +91,191 @@ class PackageManager:
             return str(local_nickel)
         
         # Try system nickel
-        result = subprocess.run(["which", "nickel"], capture_output=True, text=True)
-        if result.returncode == 0:
-            return result.stdout.strip()
+        found = shutil.which("nickel")
+        if found:
+            return found
         
         raise RuntimeError("Nickel binary not found. Please install Nickel or build it locally.")
     
     def list_packages(self) -> List[PackageInfo]:
-        """List all available packages."""
+        """List all available packages.
+        
+        The result is cached on the manager, so manifests are only evaluated
+        once per process.
+        """
+        if self._packages_cache is not None:
+            return self._packages_cache
+        
         packages = []
         
         if not self.packages_dir.exists():
             print(f"Warning: Packages directory {self.packages_dir} does not exist")
             return packages
             
-        for pkg_dir in self.packages_dir.iterdir():
-            if pkg_dir.is_dir():
-                manifest_path = pkg_dir / "Nickel-pkg.ncl"
-                if manifest_path.exists():
-                    info = self._read_package_info(pkg_dir)
-                    if info:
-                        packages.append(info)
+        pkg_dirs = [
+            pkg_dir for pkg_dir in self.packages_dir.iterdir()
+            if pkg_dir.is_dir() and (pkg_dir / "Nickel-pkg.ncl").exists()
+        ]
+        
+        # Literal manifests are parsed directly; only the rest need nickel
+        manifests = {}
+        pending = []
+        for pkg_dir in pkg_dirs:
+            manifest = self._fast_parse_manifest(pkg_dir / "Nickel-pkg.ncl")
+            if manifest is None:
+                pending.append(pkg_dir)
+            else:
+                manifests[pkg_dir.name] = manifest
+        manifests.update(self._batch_read_manifests(pending))
         
+        for pkg_dir in pkg_dirs:
+            if pkg_dir.name in manifests:
+                info = self._package_info_from_manifest(pkg_dir, manifests[pkg_dir.name])
+            else:
+                # Evaluate individually so one bad manifest doesn't hide the rest
+                info = self._read_package_info(pkg_dir)
+            if info:
+                packages.append(info)
+        
+        self._packages_cache = packages
+        self._pkg_by_name = {}
+        for info in packages:
+            self._pkg_by_name.setdefault(info.name, info)
+        for info in packages:
+            self._pkg_by_name.setdefault(info.path.name, info)
         return packages
     
+    def _find_package(self, package: str) -> Optional[PackageInfo]:
+        """Look up a package by manifest name or directory name."""
+        self.list_packages()
+        return self._pkg_by_name.get(package)
+    
+    def _fast_parse_manifest(self, manifest_path: Path) -> Optional[dict]:
+        """Read name, version and dependencies from a literal manifest without nickel.
+        
+        Returns None if the manifest uses anything beyond the plain literal
+        fields Amalgam generates, in which case it must be evaluated by nickel.
+        Dependency specs are kept as their source text.
+        """
+        try:
+            content = manifest_path.read_text()
+        except OSError:
+            return None
+        
+        if _MANIFEST_DYNAMIC_RE.search(content):
+            return None
+        shape_match = _MANIFEST_SHAPE_RE.match(_MANIFEST_COMMENT_RE.sub("", content))
+        if not shape_match:
+            return None
+        body = shape_match.group("body")
+        
+        dependencies = {}
+        deps_match = _MANIFEST_DEPS_RE.search(body)
+        if deps_match:
+            block = deps_match.group(1)
+            if "{" in block:
+                # Nested records (e.g. 'Git { ... }) need a real evaluation
+                return None
+            for line in block.splitlines():
+                if not line.strip():
+                    continue
+                entry = _MANIFEST_DEP_ENTRY_RE.fullmatch(line)
+                if not entry or "=" in entry.group(2):
+                    # Quoted names, several entries per line, ...
+                    return None
+                dependencies[entry.group(1)] = entry.group(2)
+            body = body[:deps_match.start()] + body[deps_match.end():]
+        elif "dependencies" in body:
+            return None
+        if "{" in body:
+            # A name or version inside a nested record isn't the package's own
+            return None
+        
+        name_matches = _MANIFEST_NAME_RE.findall(body)
+        version_matches = _MANIFEST_VERSION_RE.findall(body)
+        if len(name_matches) != 1 or len(version_matches) != 1:
+            return None
+        
+        return {
+            "name": name_matches[0],
+            "version": version_matches[0],
+            "dependencies": dependencies,
+        }
+    
+    def _batch_read_manifests(self, pkg_dirs: List[Path]) -> Dict[str, dict]:
+        """Evaluate all package manifests with a single nickel invocation.
+        
+        Returns a mapping of package directory name to exported manifest, or
+        an empty mapping if the batch evaluation failed.
+        """
+        if not pkg_dirs:
+            return {}
+        
+        fields = ",\n".join(
+            f'  {json.dumps(pkg_dir.name)} = import {json.dumps(str((pkg_dir / "Nickel-pkg.ncl").resolve()))}'
+            for pkg_dir in pkg_dirs
+        )
+        
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                aggregate_path = Path(tmpdir) / "packages.ncl"
+                aggregate_path.write_text(f"{{\n{fields}\n}}\n")
+                # A failed batch falls back to per-package reads, which
+                # report their own errors, so stderr isn't kept here
+                result = subprocess.run(
+                    [self.nickel_bin, "export", str(aggregate_path)],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL
+                )
+            
+            if result.returncode != 0:
+                return {}
+            
+            return _json.loads(result.stdout)
+        except Exception:
+            return {}
+    
+    def _package_info_from_manifest(self, pkg_dir: Path, manifest: dict) -> PackageInfo:
+        """Build package information from an exported manifest."""
+        return PackageInfo(
+            name=manifest.get("name", pkg_dir.name),
+            path=pkg_dir,
+            version=manifest.get("version", "0.1.0"),
+            dependencies=manifest.get("dependencies", {})
+        )
+    
     def _read_package_info(self, pkg_dir: Path) -> Optional[PackageInfo]:
         """Read package information from manifest."""
         manifest_path = pkg_dir / "Nickel-pkg.ncl"
         
+        manifest = self._fast_parse_manifest(manifest_path)
+        if manifest is not None:
+            return self._package_info_from_manifest(pkg_dir, manifest)
+        
         try:
             # Use nickel to evaluate the manifest
             result = subprocess.run(
                 [self.nickel_bin, "export", str(manifest_path)],
                 capture_output=True,
-                text=True,
                 cwd=str(pkg_dir)
             )
             
             if result.returncode != 0:
-                print(f"Warning: Failed to read manifest for {pkg_dir.name}: {result.stderr}")
+                stderr = result.stderr.decode(errors="replace")
+                print(f"Warning: Failed to read manifest for {pkg_dir.name}: {stderr}")
                 return None
             
-            manifest = json.loads(result.stdout)
+            # Parse the raw bytes directly; orjson skips the str decode
+            manifest = _json.loads(result.stdout)
             
-            return PackageInfo(
-                name=manifest.get("name", pkg_dir.name),
-                path=pkg_dir,
-                version=manifest.get("version", "0.1.0"),
-                dependencies=manifest.get("dependencies", {})
-            )
+            return self._package_info_from_manifest(pkg_dir, manifest)
         except Exception as e:
             print(f"Warning: Error reading manifest for {pkg_dir.name}: {e}")
             return None
     
     def test_package(self, package: str, mode: str = "path") -> TestResult:
         """Test a package with specified dependency mode."""
-        pkg_info = None
-        for info in self.list_packages():
-            if info.name == package or info.path.name == package:
-                pkg_info = info
-                break
+        pkg_info = self._find_package(package)
         
         if not pkg_info:
             return TestResult(
@@ -127,59 +286,61 @@ class PackageManager:
                 error=f"Package {package} not found"
             )
         
-        # Create a test directory
         with tempfile.TemporaryDirectory() as tmpdir:
-            test_dir = Path(tmpdir)
-            
-            # Create test manifest based on mode
-            if mode == "path":
-                manifest = self._create_path_manifest(pkg_info)
-            elif mode == "git":
-                manifest = self._create_git_manifest(pkg_info)
-            else:
-                manifest = self._create_index_manifest(pkg_info)
-            
-            manifest_path = test_dir / "Nickel-pkg.ncl"
-            manifest_path.write_text(manifest)
-            
-            # Create simple test file
-            test_file = test_dir / "test.ncl"
-            test_file.write_text(f'''
+            return self._run_test(pkg_info, mode, Path(tmpdir))
+    
+    def _run_test(self, pkg_info: PackageInfo, mode: str, test_dir: Path) -> TestResult:
+        """Test a package in an existing, empty test directory."""
+        # Create test manifest based on mode
+        if mode == "path":
+            manifest = self._create_path_manifest(pkg_info)
+        elif mode == "git":
+            manifest = self._create_git_manifest(pkg_info)
+        else:
+            manifest = self._create_index_manifest(pkg_info)
+        
+        manifest_path = test_dir / "Nickel-pkg.ncl"
+        manifest_path.write_text(manifest)
+        
+        # Create simple test file
+        test_file = test_dir / "test.ncl"
+        test_file.write_text(f'''
 let pkg = import "{pkg_info.name}" in
 {{
     package_loaded = pkg != null,
     package_name = "{pkg_info.name}",
 }}
 ''')
-            
-            # Run the test
-            result = subprocess.run(
-                [self.nickel_bin, "eval", str(test_file)],
-                capture_output=True,
-                text=True,
-                cwd=str(test_dir)
-            )
-            
-            return TestResult(
-                success=result.returncode == 0,
-                package=package,
-                test_type=mode,
-                output=result.stdout,
-                error=result.stderr if result.returncode != 0 else None
-            )
+        
+        # Run the test
+        result = subprocess.run(
+            [self.nickel_bin, "eval", str(test_file)],
+            capture_output=True,
+            text=True,
+            cwd=str(test_dir)
+        )
+        
+        return TestResult(
+            success=result.returncode == 0,
+            package=pkg_info.name,
+            test_type=mode,
+            output=result.stdout,
+            error=result.stderr if result.returncode != 0 else None
+        )
     
     def _create_path_manifest(self, pkg_info: PackageInfo) -> str:
         """Create a manifest with Path dependencies."""
-        deps = {}
-        for dep_name, dep_spec in pkg_info.dependencies.items():
-            deps[dep_name] = f'\'Path "{pkg_info.path}/../{dep_name}",'
+        deps = "\n        ".join([
+            f'{dep_name} = \'Path "{pkg_info.path}/../{dep_name}",'
+            for dep_name in pkg_info.dependencies
+        ])
         
         return f'''{{
     name = "test-{pkg_info.name}",
     version = "0.1.0",
     dependencies = {{
         {pkg_info.name} = 'Path "{pkg_info.path}",
-        {self._format_deps(deps)}
+        {deps}
     }},
 }} | std.package.Manifest'''
     
@@ -189,13 +350,14 @@ let pkg = import "{pkg_info.name}" in
         # You'll need to adjust the URL to your actual repo
         git_url = "https://github.com/seryl/amalgam"  # Replace with your repo
         
-        deps = {}
-        for dep_name, dep_spec in pkg_info.dependencies.items():
-            deps[dep_name] = f'''\'Git {{
+        deps = "\n        ".join([
+            f'''{dep_name} = \'Git {{
                 url = "{git_url}",
                 ref = "main",
                 path = "examples/pkgs/{dep_name}"
             }},'''
+            for dep_name in pkg_info.dependencies
+        ])
         
         return f'''{{
     name = "test-{pkg_info.name}",
@@ -206,19 +368,20 @@ let pkg = import "{pkg_info.name}" in
             ref = "main",
             path = "examples/pkgs/{pkg_info.name}"
         }},
-        {self._format_deps(deps)}
+        {deps}
     }},
 }} | std.package.Manifest'''
     
     def _create_index_manifest(self, pkg_info: PackageInfo) -> str:
         """Create a manifest with Index dependencies."""
         # This assumes packages are published to nickel-mine
-        deps = {}
-        for dep_name, dep_spec in pkg_info.dependencies.items():
-            deps[dep_name] = f'''\'Index {{
+        deps = "\n        ".join([
+            f'''{dep_name} = \'Index {{
                 package = "github:amalgam/{dep_name}",
                 version = "0.1.0"
             }},'''
+            for dep_name in pkg_info.dependencies
+        ])
         
         return f'''{{
     name = "test-{pkg_info.name}",
@@ -228,21 +391,13 @@ let pkg = import "{pkg_info.name}" in
             package = "github:amalgam/{pkg_info.name}",
             version = "{pkg_info.version}"
         }},
-        {self._format_deps(deps)}
+        {deps}
     }},
 }} | std.package.Manifest'''
     
-    def _format_deps(self, deps: Dict[str, str]) -> str:
-        """Format dependencies for manifest."""
-        return "\n        ".join(f"{name} = {spec}" for name, spec in deps.items())
-    
     def validate_package(self, package: str) -> TestResult:
         """Validate a package structure and syntax."""
-        pkg_info = None
-        for info in self.list_packages():
-            if info.name == package or info.path.name == package:
-                pkg_info = info
-                break
+        pkg_info = self._find_package(package)
         
         if not pkg_info:
             return TestResult(
@@ -253,12 +408,57 @@ let pkg = import "{pkg_info.name}" in
                 error=f"Package {package} not found"
             )
         
-        # Check manifest
-        manifest_result = subprocess.run(
-            [self.nickel_bin, "typecheck", str(pkg_info.path / "Nickel-pkg.ncl")],
-            capture_output=True,
-            text=True
-        )
+        ncl_files = list(iter_ncl_files(str(pkg_info.path)))
+        
+        # Skip typechecking entirely if nothing changed since the last
+        # successful validation of this package or of anything it imports
+        # from the packages it depends on
+        cache = self._load_typecheck_cache()
+        cache_key = str(pkg_info.path.resolve())
+        fingerprinted = list(ncl_files)
+        for dep_info in self._dependency_closure(pkg_info):
+            fingerprinted.extend(iter_ncl_files(str(dep_info.path)))
+        fingerprint = self._fingerprint_files(self.packages_dir, fingerprinted)
+        if cache.get(cache_key) == fingerprint:
+            return TestResult(
+                success=True,
+                package=package,
+                test_type="validate",
+                output=f"Package {package} is valid",
+                error=None
+            )
+        
+        # Typecheck the manifest and batches of .ncl files concurrently; each
+        # nickel process is dominated by startup cost, so files are checked
+        # several at a time while still keeping every worker busy.
+        manifest_path = os.path.join(pkg_info.path, "Nickel-pkg.ncl")
+        sources = [ncl_file for ncl_file in ncl_files if ncl_file != manifest_path]
+        workers = os.cpu_count() or 1
+        batch_size = max(1, min(_TYPECHECK_BATCH_SIZE, -(-len(sources) // workers)))
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            manifest_future = executor.submit(self._typecheck, [manifest_path])
+            futures = {
+                executor.submit(self._typecheck, batch): batch
+                for batch in (
+                    sources[i:i + batch_size] for i in range(0, len(sources), batch_size)
+                )
+            }
+            while futures:
+                retries = {}
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    result = future.result()
+                    if result.returncode == 0:
+                        continue
+                    if len(batch) == 1:
+                        errors.append((Path(batch[0]).relative_to(pkg_info.path), result.stderr))
+                    else:
+                        # Re-check one file at a time to attribute the failure
+                        for ncl_file in batch:
+                            retries[executor.submit(self._typecheck, [ncl_file])] = [ncl_file]
+                futures = retries
+            manifest_result = manifest_future.result()
         
         if manifest_result.returncode != 0:
             return TestResult(
@@ -269,16 +469,8 @@ let pkg = import "{pkg_info.name}" in
                 error=f"Manifest validation failed: {manifest_result.stderr}"
             )
         
-        # Check all .ncl files
-        errors = []
-        for ncl_file in pkg_info.path.rglob("*.ncl"):
-            result = subprocess.run(
-                [self.nickel_bin, "typecheck", str(ncl_file)],
-                capture_output=True,
-                text=True
-            )
-            if result.returncode != 0:
-                errors.append(f"{ncl_file.relative_to(pkg_info.path)}: {result.stderr}")
+        # Keep error ordering deterministic regardless of completion order
+        errors = [f"{path}: {stderr}" for path, stderr in sorted(errors)]
         
         if errors:
             return TestResult(
@@ -289,6 +481,9 @@ let pkg = import "{pkg_info.name}" in
                 error="\n".join(errors)
             )
         
+        cache[cache_key] = fingerprint
+        self._save_typecheck_cache(cache)
+        
         return TestResult(
             success=True,
             package=package,
@@ -297,13 +492,83 @@ let pkg = import "{pkg_info.name}" in
             error=None
         )
     
+    def _dependency_closure(self, pkg_info: PackageInfo) -> List[PackageInfo]:
+        """Return the packages ``pkg_info`` depends on, directly or transitively.
+        
+        Dependencies are matched by name and by the last component of any
+        path in their spec (e.g. ``'Path "../k8s_io"``).
+        """
+        self.list_packages()
+        seen = {pkg_info.path.resolve()}
+        closure = []
+        pending = [pkg_info]
+        while pending:
+            info = pending.pop()
+            for dep_name, spec in info.dependencies.items():
+                names = {dep_name}
+                if isinstance(spec, str):
+                    names.update(m.group("name") for m in _PATH_DEP_RE.finditer(spec))
+                elif isinstance(spec, dict):
+                    names.update(
+                        os.path.basename(value.rstrip("/"))
+                        for value in spec.values() if isinstance(value, str)
+                    )
+                for name in names:
+                    dep_info = self._pkg_by_name.get(name)
+                    if dep_info is None or dep_info.path.resolve() in seen:
+                        continue
+                    seen.add(dep_info.path.resolve())
+                    closure.append(dep_info)
+                    pending.append(dep_info)
+        return closure
+    
+    def _fingerprint_files(self, root: Path, files: List[str]) -> str:
+        """Hash the identity (path, mtime, size) of a set of files.
+        
+        Whole packages (with their dependencies) are fingerprinted rather than
+        individual files since a file's typecheck result depends on the files
+        it imports. The nickel binary is included so a rebuilt or upgraded
+        nickel at the same path invalidates the cache.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        nickel_st = os.stat(self.nickel_bin)
+        digest.update(f"{self.nickel_bin}\0{nickel_st.st_mtime_ns}\0{nickel_st.st_size}".encode())
+        for path in sorted(files):
+            st = os.stat(path)
+            digest.update(f"\0{os.path.relpath(path, root)}\0{st.st_mtime_ns}\0{st.st_size}".encode())
+        return digest.hexdigest()
+    
+    def _load_typecheck_cache(self) -> Dict[str, str]:
+        """Load the package fingerprints of previous successful validations."""
+        try:
+            with open(self.typecheck_cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_typecheck_cache(self, cache: Dict[str, str]) -> None:
+        """Atomically write the typecheck cache; failures are not fatal."""
+        try:
+            self.typecheck_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.typecheck_cache_path.with_name(
+                f"{self.typecheck_cache_path.name}.{os.getpid()}.tmp"
+            )
+            tmp_path.write_text(json.dumps(cache, indent=2))
+            os.replace(tmp_path, self.typecheck_cache_path)
+        except OSError as e:
+            print(f"Warning: Could not write typecheck cache: {e}")
+    
+    def _typecheck(self, ncl_files: List[str]) -> subprocess.CompletedProcess:
+        """Run `nickel typecheck` on one or more files in a single process."""
+        return subprocess.run(
+            [self.nickel_bin, "typecheck", *ncl_files],
+            capture_output=True,
+            text=True
+        )
+    
     def prepare_for_publishing(self, package: str, target_dir: Path) -> bool:
         """Prepare a package for publishing to nickel-mine."""
-        pkg_info = None
-        for info in self.list_packages():
-            if info.name == package or info.path.name == package:
-                pkg_info = info
-                break
+        pkg_info = self._find_package(package)
         
         if not pkg_info:
             print(f"Error: Package {package} not found")
@@ -313,37 +578,71 @@ let pkg = import "{pkg_info.name}" in
         target_dir.mkdir(parents=True, exist_ok=True)
         pkg_target = target_dir / pkg_info.name
         
-        # Copy package files
+        # Hardlink package files instead of copying their contents
         if pkg_target.exists():
             shutil.rmtree(pkg_target)
-        shutil.copytree(pkg_info.path, pkg_target)
+        try:
+            shutil.copytree(pkg_info.path, pkg_target, copy_function=os.link)
+        except OSError:
+            # Hardlinks can't cross filesystems; fall back to a full copy
+            shutil.rmtree(pkg_target, ignore_errors=True)
+            shutil.copytree(pkg_info.path, pkg_target)
         
         # Update manifest for publishing
         manifest_path = pkg_target / "Nickel-pkg.ncl"
         manifest_content = manifest_path.read_text()
         
         # Replace Path dependencies with Index dependencies
-        # This is a simple regex replacement - might need refinement
-        manifest_content = re.sub(
-            r"'Path\s+\"[^\"]+\"",
-            lambda m: self._path_to_index(m.group(0)),
+        # For now, assume all packages are under amalgam org
+        manifest_content = _PATH_DEP_RE.sub(
+            r"""'Index { package = "github:amalgam/\g<name>", version = "0.1.0" }""",
             manifest_content
         )
         
+        # Break the hardlink so the source manifest is left untouched
+        manifest_path.unlink()
         manifest_path.write_text(manifest_content)
         
         print(f"Package {package} prepared for publishing at {pkg_target}")
         return True
-    
-    def _path_to_index(self, path_dep: str) -> str:
-        """Convert a Path dependency to an Index dependency."""
-        # Extract package name from path
-        match = re.search(r'"([^/]+)"', path_dep)
-        if match:
-            pkg_name = match.group(1)
-            # For now, assume all packages are under amalgam org
-            return f"'Index {{ package = \"github:amalgam/{pkg_name}\", version = \"0.1.0\" }}"
-        return path_dep
+
+
+def iter_ncl_files(root: str) -> Iterator[str]:
+    """Recursively yield paths of .ncl files under `root`, skipping _SKIP_DIRS."""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in _SKIP_DIRS:
+                    yield from iter_ncl_files(entry.path)
+            elif entry.name.endswith(".ncl"):
+                yield entry.path
+
+
+def positive_int(value: str) -> int:
+    """argparse type for options that must be a positive integer."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def find_workspace_root(start: str) -> Optional[Path]:
+    """Walk up from `start` to the first directory whose Cargo.toml mentions amalgam."""
+    current = start
+    while True:
+        cargo_toml = os.path.join(current, "Cargo.toml")
+        if os.path.isfile(cargo_toml):
+            # The package/workspace header is at the top of the file
+            with open(cargo_toml, "rb") as f:
+                if b"amalgam" in f.read(4096):
+                    return Path(current)
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
 
 
 def main():
@@ -351,14 +650,8 @@ def main():
     parser = argparse.ArgumentParser(description="Amalgam Nickel package management tools")
     
     # Find workspace root
-    current_dir = Path.cwd()
-    workspace_root = current_dir
-    while workspace_root.parent != workspace_root:
-        if (workspace_root / "Cargo.toml").exists() and "amalgam" in (workspace_root / "Cargo.toml").read_text():
-            break
-        workspace_root = workspace_root.parent
-    
-    if not (workspace_root / "Cargo.toml").exists():
+    workspace_root = find_workspace_root(os.getcwd())
+    if workspace_root is None:
         print("Error: Could not find Amalgam workspace root")
         sys.exit(1)
     
@@ -394,7 +687,18 @@ def main():
     )
     
     # Test all packages
-    subparsers.add_parser("test-all", help="Test all packages")
+    test_all_parser = subparsers.add_parser("test-all", help="Test all packages")
+    test_all_parser.add_argument(
+        "--jobs", "-j",
+        type=positive_int,
+        default=os.cpu_count(),
+        help="Number of package tests to run in parallel"
+    )
+    test_all_parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="Stop after the first failing test"
+    )
     
     args = parser.parse_args()
     
@@ -439,17 +743,34 @@ def main():
     
     elif args.command == "test-all":
         packages = manager.list_packages()
+        modes = ["path"]  # Start with path mode only
         failed = []
         
-        for pkg in packages:
-            print(f"Testing {pkg.name}...")
-            for mode in ["path"]:  # Start with path mode only
-                result = manager.test_package(pkg.name, mode)
+        # Share one temporary directory across all tests, one subdirectory each
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = []
+            for pkg in packages:
+                for mode in modes:
+                    test_dir = Path(tmpdir) / f"{pkg.path.name}-{mode}"
+                    test_dir.mkdir(parents=True)
+                    futures.append(executor.submit(manager._run_test, pkg, mode, test_dir))
+            # Results are reported from this thread only, so output lines
+            # never interleave.
+            for future in as_completed(futures):
+                result = future.result()
                 if result.success:
-                    print(f"  ✅ {mode} mode: passed")
+                    print(f"  ✅ {result.package} ({result.test_type} mode): passed")
                 else:
-                    print(f"  ❌ {mode} mode: failed")
-                    failed.append((pkg.name, mode))
+                    print(f"  ❌ {result.package} ({result.test_type} mode): failed")
+                    failed.append((result.package, result.test_type))
+                    if args.fail_fast:
+                        # Drop queued tests; ones already running still finish
+                        print("  ⏹  Stopping after first failure (--fail-fast)")
+                        executor.shutdown(cancel_futures=True)
+                        break
+        
+        failed.sort()
         
         if failed:
             print(f"\n❌ {len(failed)} tests failed:")
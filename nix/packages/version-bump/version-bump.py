@@ -15,6 +15,10 @@ from typing import Tuple, Optional
 from enum import Enum
 
 
+_SEMVER_RE = re.compile(r"^(\d+)\.(\d+)\.(\d+)")
+_WORKSPACE_VERSION_RE = re.compile(r'(\[workspace\.package\][^\[]*version = ")[^"]+(")')
+
+
 class BumpType(Enum):
     MAJOR = "major"
     MINOR = "minor"
@@ -40,7 +44,14 @@ class SmartError:
 
 def parse_version(version: str) -> Tuple[int, int, int]:
     """Parse a semantic version string into major, minor, patch components."""
-    match = re.match(r"^(\d+)\.(\d+)\.(\d+)", version)
+    # Fast path for plain `X.Y.Z[-pre][+build]` versions
+    parts = version.split(".", 2)
+    if len(parts) == 3 and version.isascii():
+        patch = parts[2].split("-", 1)[0].split("+", 1)[0]
+        if parts[0].isdigit() and parts[1].isdigit() and patch.isdigit():
+            return int(parts[0]), int(parts[1]), int(patch)
+
+    match = _SEMVER_RE.match(version)
     if not match:
         raise ValueError(f"Invalid version format: {version}")
     return int(match.group(1)), int(match.group(2)), int(match.group(3))
@@ -77,27 +88,33 @@ class VersionBumper:
     def update_workspace_version(self, new_version: str) -> None:
         """Update the workspace version in Cargo.toml."""
         content = self.workspace_toml.read_text()
+        data = tomllib.loads(content)
+        workspace = data["workspace"]
+        old_version = workspace["package"]["version"]
 
-        # Update workspace version
-        pattern = r'(\[workspace\.package\][^\[]*version = ")[^"]+(")'
-        content = re.sub(pattern, rf'\g<1>{new_version}\g<2>', content)
-
-        # Update workspace dependency versions
+        # Internal crates are the workspace dependencies pinned to the
+        # workspace version (with a crates/ path in local mode)
         workspace_deps = [
-            "amalgam-core",
-            "amalgam-parser",
-            "amalgam-codegen",
-            "amalgam-daemon",
-            "amalgam",
+            name
+            for name, spec in workspace.get("dependencies", {}).items()
+            if isinstance(spec, dict)
+            and spec.get("version") == old_version
+            and ("path" in spec or name.startswith("amalgam"))
         ]
 
-        for dep in workspace_deps:
-            # Update in [workspace.dependencies]
-            pattern = rf'({dep} = {{ version = ")[^"]+(")'
-            content = re.sub(pattern, rf'\g<1>{new_version}\g<2>', content)
+        # Update workspace version; bail out before writing anything if the
+        # version line isn't in the form we rewrite
+        content, count = _WORKSPACE_VERSION_RE.subn(rf'\g<1>{new_version}\g<2>', content)
+        if not count:
+            raise ValueError("could not find the version in [workspace.package]")
 
-        self.workspace_toml.write_text(content)
+        # Update workspace dependency versions in a single pass
+        if workspace_deps:
+            names = "|".join(map(re.escape, workspace_deps))
+            pattern = rf'^((?:{names}) = {{ version = ")[^"]+(")'
+            content = re.sub(pattern, rf'\g<1>{new_version}\g<2>', content, flags=re.MULTILINE)
 
+        self.workspace_toml.write_text(content)
 
     def bump(self, bump_type: BumpType) -> str:
         """Bump the workspace version and update all references."""
@@ -112,15 +129,27 @@ class VersionBumper:
             self.update_workspace_version(new_version)
             print(f"✅ Updated Cargo.toml")
 
-            # Update Cargo.lock
+            # Update Cargo.lock; only workspace crates changed, so try without
+            # refreshing the registry index first and only go online if the
+            # local index can't resolve the lockfile (e.g. a fresh clone)
             print(f"🔄 Updating Cargo.lock...")
             try:
-                subprocess.run(
-                    ["cargo", "update", "--workspace"],
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
+                # Only stderr is reported, so stdout doesn't need a pipe
+                try:
+                    subprocess.run(
+                        ["cargo", "update", "--workspace", "--offline"],
+                        check=True,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL
+                    )
+                except subprocess.CalledProcessError:
+                    subprocess.run(
+                        ["cargo", "update", "--workspace"],
+                        check=True,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.PIPE,
+                        text=True
+                    )
                 print(f"✅ Updated Cargo.lock")
             except subprocess.CalledProcessError as e:
                 print(f"⚠️  Warning: Failed to update Cargo.lock: {e.stderr}")
@@ -10,14 +10,94 @@ It dynamically reads workspace dependencies from Cargo.toml, so it
 automatically handles any workspace crates without hardcoding.
 """
 
+import copy
+import io
+import mmap
+import os
+import re
 import subprocess
 import sys
+import tempfile
+import threading
 import tomllib
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from enum import Enum
 
 
+# Files at least this large are scanned through mmap instead of read()
+_MMAP_THRESHOLD = 4096
+
+# Headers of the tables we rewrite; TOML allows spaces inside the brackets
+# and around the dot, and a trailing comment after the header
+_SECTION_RE = re.compile(
+    r'^\[\s*(workspace\s*\.\s*dependencies|dependencies|dev-dependencies)\s*\]\s*(?:#.*)?$'
+)
+
+
+def _read_fd(fd: int, size: int) -> bytes:
+    """Read ``size`` bytes from an open descriptor, normally in one call."""
+    data = os.read(fd, size)
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def _read_bytes(path) -> bytes:
+    """Read a whole file with raw os.open/os.read, skipping io buffering."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return _read_fd(fd, os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
+
+
+def _atomic_write_text(path: Path, text: str) -> None:
+    """Write a file via a temp file in the same directory and os.replace."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".toml")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _section_spans(content: str) -> Tuple[List[int], List[Optional[str]]]:
+    """Record the line where each TOML table starts, for bisect lookups.
+
+    Lines inside multi-line strings map to no section, so text there that
+    looks like a header or a dependency is left alone.
+    """
+    starts: List[int] = []
+    sections: List[Optional[str]] = []
+    section = None
+    open_string = None
+
+    for line_no, line in enumerate(io.StringIO(content)):
+        if open_string is None and line.lstrip().startswith("["):
+            match = _SECTION_RE.match(line.strip())
+            section = "".join(match.group(1).split()) if match else None
+            starts.append(line_no)
+            sections.append(section)
+
+        for delim in ('"""', "'''"):
+            if open_string in (None, delim) and line.count(delim) % 2:
+                open_string = None if open_string else delim
+                starts.append(line_no + 1)
+                sections.append(section if open_string is None else None)
+
+    return starts, sections
+
+
 class DependencyMode(Enum):
     LOCAL = "local"
     REMOTE = "remote"
@@ -50,64 +130,100 @@ class WorkspaceDepsManager:
         self.root = root
         self.workspace_toml = root / "Cargo.toml"
         self.crates_dir = root / "crates"
-        self._workspace_deps = None
-        self._workspace_version = None
+        self._toml_cache: Dict[Path, dict] = {}
+        self._toml_cache_lock = threading.Lock()
+
+    def _load_toml(self, path: Path) -> dict:
+        """Parse a TOML file, memoized until the file is rewritten.
 
-    @property
+        Callers get their own copy so they can't corrupt the cache.
+        """
+        key = Path(path).resolve()
+        with self._toml_cache_lock:
+            data = self._toml_cache.get(key)
+        if data is None:
+            data = tomllib.load(io.BytesIO(_read_bytes(key)))
+            with self._toml_cache_lock:
+                self._toml_cache[key] = data
+        return copy.deepcopy(data)
+
+    @cached_property
     def workspace_deps(self) -> Set[str]:
         """Dynamically discover workspace dependencies."""
-        if self._workspace_deps is None:
-            self._workspace_deps = self.discover_workspace_deps()
-        return self._workspace_deps
+        return self.discover_workspace_deps()
 
-    @property
+    @cached_property
     def workspace_version(self) -> str:
         """Get the current workspace version."""
-        if self._workspace_version is None:
-            with open(self.workspace_toml, "rb") as f:
-                data = tomllib.load(f)
-                self._workspace_version = data["workspace"]["package"]["version"]
-        return self._workspace_version
+        data = self._load_toml(self.workspace_toml)
+        return data["workspace"]["package"]["version"]
+
+    @cached_property
+    def _dep_assignment_re(self) -> "re.Pattern[bytes]":
+        """Match `<dep> = <value>` lines for any workspace dep, built once.
+
+        The pattern works on bytes so files can be scanned without decoding.
+        """
+        names = b'|'.join(re.escape(dep.encode()) for dep in sorted(self.workspace_deps))
+        return re.compile(
+            rb'^(?P<name>' + names + rb')[ \t]*=[ \t]*(?P<rhs>.+)$',
+            re.MULTILINE,
+        )
 
     def discover_workspace_deps(self) -> Set[str]:
         """Discover all workspace dependencies from Cargo.toml."""
         workspace_deps = set()
-
-        with open(self.workspace_toml, "rb") as f:
-            data = tomllib.load(f)
-
-            # Get dependencies from [workspace.dependencies]
-            if "workspace" in data and "dependencies" in data["workspace"]:
-                for dep_name, dep_info in data["workspace"]["dependencies"].items():
-                    # Check if this is an internal workspace dependency
-                    # by looking for path references to crates/
-                    if isinstance(dep_info, dict) and "path" in dep_info:
-                        if dep_info["path"].startswith("crates/"):
-                            workspace_deps.add(dep_name)
-                    # Also check if the dependency name matches our workspace pattern
-                    elif dep_name.startswith("amalgam-"):
+        # Crate directories whose package is already known from the workspace table
+        known_dirs = set()
+
+        data = self._load_toml(self.workspace_toml)
+
+        # Get dependencies from [workspace.dependencies]
+        if "workspace" in data and "dependencies" in data["workspace"]:
+            for dep_name, dep_info in data["workspace"]["dependencies"].items():
+                # Check if this is an internal workspace dependency
+                # by looking for path references to crates/
+                if isinstance(dep_info, dict) and "path" in dep_info:
+                    if dep_info["path"].startswith("crates/"):
                         workspace_deps.add(dep_name)
-
-        # Also discover by looking at what's actually in crates/
-        for crate_dir in self.crates_dir.iterdir():
-            if not crate_dir.is_dir():
+                        known_dirs.add(os.path.basename(dep_info["path"].rstrip("/")))
+                # Also check if the dependency name matches our workspace pattern
+                elif dep_name.startswith("amalgam-"):
+                    workspace_deps.add(dep_name)
+                    known_dirs.add(self.get_crate_dir_for_dep(dep_name))
+
+        # Set AMALGAM_DEEP_SCAN to re-parse every crate, even known ones
+        if os.environ.get("AMALGAM_DEEP_SCAN"):
+            known_dirs.clear()
+
+        # Also discover by looking at what's actually in crates/, only parsing
+        # the crates not already covered above
+        for cargo_toml in self._iter_crate_tomls():
+            if os.path.basename(os.path.dirname(cargo_toml)) in known_dirs:
+                continue
+            try:
+                crate_data = self._load_toml(cargo_toml)
+                if "package" in crate_data and "name" in crate_data["package"]:
+                    crate_name = crate_data["package"]["name"]
+                    if crate_name.startswith("amalgam"):
+                        workspace_deps.add(crate_name)
+            except Exception:
+                # Skip malformed Cargo.toml files
                 continue
-
-            cargo_toml = crate_dir / "Cargo.toml"
-            if cargo_toml.exists():
-                with open(cargo_toml, "rb") as f:
-                    try:
-                        crate_data = tomllib.load(f)
-                        if "package" in crate_data and "name" in crate_data["package"]:
-                            crate_name = crate_data["package"]["name"]
-                            if crate_name.startswith("amalgam"):
-                                workspace_deps.add(crate_name)
-                    except Exception:
-                        # Skip malformed Cargo.toml files
-                        continue
 
         return workspace_deps
 
+    def _iter_crate_tomls(self) -> Iterator[str]:
+        """Yield the Cargo.toml path of each crate directory under crates/."""
+        with os.scandir(self.crates_dir) as entries:
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+
+                cargo_toml = os.path.join(entry.path, "Cargo.toml")
+                if os.path.isfile(cargo_toml):
+                    yield cargo_toml
+
     def get_crate_dir_for_dep(self, dep_name: str) -> str:
         """Get the crate directory name for a dependency."""
         # Handle special cases
@@ -121,33 +237,47 @@ class WorkspaceDepsManager:
         has_local = False
         has_remote = False
 
-        for crate_dir in self.crates_dir.iterdir():
-            if not crate_dir.is_dir():
-                continue
+        if not self.workspace_deps:
+            return DependencyMode.UNKNOWN
 
-            cargo_toml = crate_dir / "Cargo.toml"
-            if not cargo_toml.exists():
+        # Crates are listed lazily so an early MIXED result stops the scan
+        for toml_path in self._iter_crate_tomls():
+            fd = os.open(toml_path, os.O_RDONLY)
+            try:
+                size = os.fstat(fd).st_size
+                if size < _MMAP_THRESHOLD:
+                    content = _read_fd(fd, size)
+                else:
+                    content = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+
+            try:
+                for match in self._dep_assignment_re.finditer(content):
+                    rhs = match.group("rhs")
+                    if b"workspace = true" in rhs:
+                        # Inherited from the workspace definition
+                        continue
+                    if b"path =" in rhs:
+                        has_local = True
+                    elif rhs.startswith(b'"') or b"version =" in rhs:
+                        has_remote = True
+
+                    if has_local and has_remote:
+                        return DependencyMode.MIXED
+            finally:
+                if isinstance(content, mmap.mmap):
+                    content.close()
+
+        # Also check workspace dependencies, using the already-parsed table
+        workspace_data = self._load_toml(self.workspace_toml)
+        workspace_table = workspace_data.get("workspace", {}).get("dependencies", {})
+        for dep_name, dep_value in workspace_table.items():
+            if dep_name not in self.workspace_deps:
                 continue
-
-            content = cargo_toml.read_text()
-
-            # Check for path dependencies
-            for dep in self.workspace_deps:
-                # Look for various patterns
-                if f'{dep} = {{ version = ' in content and 'path = ' in content:
-                    has_local = True
-                elif f'{dep}.workspace = true' in content:
-                    # Check workspace definition
-                    pass
-                elif f'{dep} = "' in content:
-                    has_remote = True
-
-        # Also check workspace dependencies
-        workspace_content = self.workspace_toml.read_text()
-        for dep in self.workspace_deps:
-            if f'{dep} = {{ version = ' in workspace_content and 'path = ' in workspace_content:
+            if isinstance(dep_value, dict) and "path" in dep_value:
                 has_local = True
-            elif f'{dep} = {{ version = ' in workspace_content and 'path = ' not in workspace_content:
+            elif isinstance(dep_value, str) or "version" in dep_value:
                 has_remote = True
 
         if has_local and has_remote:
@@ -159,13 +289,33 @@ class WorkspaceDepsManager:
         else:
             return DependencyMode.UNKNOWN
 
-    def update_workspace_dependencies(self, mode: DependencyMode) -> None:
-        """Update all workspace dependencies to the specified mode."""
+    def update_workspace_dependencies(self, mode: DependencyMode) -> int:
+        """Update all workspace dependencies to the specified mode.
+
+        Returns the number of Cargo.toml files that were rewritten.
+        """
         version = self.workspace_version
 
+        # The target value for each dep is the same in every crate
+        crate_dir_by_dep = {d: self.get_crate_dir_for_dep(d) for d in self.workspace_deps}
+        if mode == DependencyMode.LOCAL:
+            # Add path for local development
+            workspace_values = {
+                d: {"version": version, "path": f"crates/{crate_dir_by_dep[d]}"}
+                for d in self.workspace_deps
+            }
+            crate_values = {
+                d: {"version": version, "path": f"../{crate_dir_by_dep[d]}"}
+                for d in self.workspace_deps
+            }
+        else:
+            # Remove path for publishing
+            workspace_values = {d: {"version": version} for d in self.workspace_deps}
+            crate_values = {d: version for d in self.workspace_deps}
+
         # Read the workspace Cargo.toml
-        with open(self.workspace_toml, "rb") as f:
-            workspace_data = tomllib.load(f)
+        workspace_data = self._load_toml(self.workspace_toml)
+        changed = 0
 
         # Update [workspace.dependencies] section
         if "workspace" in workspace_data and "dependencies" in workspace_data["workspace"]:
@@ -173,150 +323,153 @@ class WorkspaceDepsManager:
 
             for dep_name in self.workspace_deps:
                 if dep_name in workspace_data["workspace"]["dependencies"]:
-                    crate_dir = self.get_crate_dir_for_dep(dep_name)
-
-                    if mode == DependencyMode.LOCAL:
-                        # Add path for local development
-                        deps_to_update[dep_name] = {
-                            "version": version,
-                            "path": f"crates/{crate_dir}"
-                        }
-                    else:
-                        # Remove path for publishing
-                        deps_to_update[dep_name] = {
-                            "version": version
-                        }
+                    deps_to_update[dep_name] = workspace_values[dep_name]
 
             # Now update the actual file
-            self.update_cargo_toml_deps(self.workspace_toml, deps_to_update, is_workspace=True)
+            changed += self.update_cargo_toml_deps(
+                self.workspace_toml, {"workspace.dependencies": deps_to_update}, is_workspace=True
+            )
 
-        # Update all crate dependencies
-        updated_crates = []
-        for crate_dir in self.crates_dir.iterdir():
-            if not crate_dir.is_dir():
-                continue
+        # Update all crate dependencies; each crate is an independent file
+        with os.scandir(self.crates_dir) as it:
+            entries = [entry for entry in it if entry.is_dir(follow_symlinks=False)]
 
-            cargo_toml = crate_dir / "Cargo.toml"
-            if not cargo_toml.exists():
-                continue
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = list(executor.map(lambda e: self._process_crate(e, crate_values), entries))
+        updated_crates = [name for name in results if name is not None]
 
-            # Check if this crate uses any workspace dependencies
-            with open(cargo_toml, "rb") as f:
-                try:
-                    crate_data = tomllib.load(f)
-                except Exception:
+        if updated_crates:
+            print(f"✅ Updated dependencies in: {', '.join(updated_crates)}")
+
+        return changed + len(updated_crates)
+
+    def _process_crate(self, entry: os.DirEntry, crate_values: Dict) -> Optional[str]:
+        """Rewrite one crate's workspace deps; returns the crate name if updated."""
+        cargo_toml = Path(entry.path) / "Cargo.toml"
+        if not cargo_toml.is_file():
+            return None
+
+        # Check if this crate uses any workspace dependencies
+        try:
+            crate_data = self._load_toml(cargo_toml)
+        except Exception:
+            return None
+
+        deps_by_section: Dict[str, Dict] = {}
+        workspace_deps = self.workspace_deps
+
+        # Check regular dependencies, then dev-dependencies; only visit the
+        # deps the crate actually declares
+        for section in ("dependencies", "dev-dependencies"):
+            for dep_name, dep_value in crate_data.get(section, {}).items():
+                if dep_name not in workspace_deps:
                     continue
+                # Only update if it's not using workspace = true
+                if not (isinstance(dep_value, dict) and dep_value.get("workspace") is True):
+                    deps_by_section.setdefault(section, {})[dep_name] = crate_values[dep_name]
+
+        if deps_by_section and self.update_cargo_toml_deps(cargo_toml, deps_by_section, is_workspace=False):
+            return entry.name
+        return None
+
+    def update_cargo_toml_deps(
+        self, toml_path: Path, deps_by_section: Dict[str, Dict], is_workspace: bool
+    ) -> bool:
+        """Update specific dependencies in a Cargo.toml file.
+
+        ``deps_by_section`` maps a section name (``dependencies``,
+        ``dev-dependencies`` or ``workspace.dependencies``) to the new value
+        of each dependency to rewrite in that section. Returns whether the
+        file changed; an unchanged file is left untouched.
+        """
+        dep_names = set().union(*deps_by_section.values())
+        if not dep_names:
+            return False
 
-            deps_to_update = {}
+        content = _read_bytes(toml_path).decode("utf-8")
 
-            # Check regular dependencies
-            if "dependencies" in crate_data:
-                for dep_name in self.workspace_deps:
-                    if dep_name in crate_data["dependencies"]:
-                        dep_value = crate_data["dependencies"][dep_name]
-                        # Only update if it's not using workspace = true
-                        if not (isinstance(dep_value, dict) and dep_value.get("workspace") is True):
-                            if mode == DependencyMode.LOCAL:
-                                crate_dir_name = self.get_crate_dir_for_dep(dep_name)
-                                deps_to_update[dep_name] = {
-                                    "version": version,
-                                    "path": f"../{crate_dir_name}"
-                                }
-                            else:
-                                deps_to_update[dep_name] = version
-
-            # Check dev-dependencies too
-            if "dev-dependencies" in crate_data:
-                for dep_name in self.workspace_deps:
-                    if dep_name in crate_data["dev-dependencies"]:
-                        dep_value = crate_data["dev-dependencies"][dep_name]
-                        if not (isinstance(dep_value, dict) and dep_value.get("workspace") == True):
-                            if mode == DependencyMode.LOCAL:
-                                crate_dir_name = self.get_crate_dir_for_dep(dep_name)
-                                deps_to_update[f"dev.{dep_name}"] = {
-                                    "version": version,
-                                    "path": f"../{crate_dir_name}"
-                                }
-                            else:
-                                deps_to_update[f"dev.{dep_name}"] = version
-
-            if deps_to_update:
-                self.update_cargo_toml_deps(cargo_toml, deps_to_update, is_workspace=False)
-                updated_crates.append(crate_dir.name)
+        dep_line_re = re.compile(r'^\s*(' + '|'.join(map(re.escape, sorted(dep_names))) + r')\s*=')
 
-        if updated_crates:
-            print(f"✅ Updated dependencies in: {', '.join(updated_crates)}")
+        # Render every replacement line up front; the per-line work below is
+        # then just a regex match and a dict lookup
+        new_lines = {
+            section: {name: self._format_dep_line(name, value) for name, value in deps.items()}
+            for section, deps in deps_by_section.items()
+        }
 
-    def update_cargo_toml_deps(self, toml_path: Path, deps_to_update: Dict, is_workspace: bool) -> None:
-        """Update specific dependencies in a Cargo.toml file."""
-        content = toml_path.read_text()
-        lines = content.splitlines(keepends=True)
-
-        updated_lines = []
-        current_section = None
-
-        for line in lines:
-            # Track which section we're in
-            if line.strip().startswith("["):
-                if "[workspace.dependencies]" in line:
-                    current_section = "workspace.dependencies"
-                elif "[dependencies]" in line:
-                    current_section = "dependencies"
-                elif "[dev-dependencies]" in line:
-                    current_section = "dev-dependencies"
-                else:
-                    current_section = None
+        section_starts, section_names = _section_spans(content)
+        out = io.StringIO()
 
-            # Check if we need to update this line
-            line_updated = False
-            if current_section:
-                for dep_name, dep_value in deps_to_update.items():
-                    # Handle dev dependencies special case
-                    actual_dep = dep_name.replace("dev.", "") if dep_name.startswith("dev.") else dep_name
-
-                    # Only update if we're in the right section
-                    if dep_name.startswith("dev.") and current_section != "dev-dependencies":
-                        continue
-                    if not dep_name.startswith("dev.") and current_section == "dev-dependencies":
-                        continue
+        for line_no, line in enumerate(io.StringIO(content)):
+            # Look up which section we're in
+            span = bisect_right(section_starts, line_no) - 1
+            current_section = section_names[span] if span >= 0 else None
 
-                    if actual_dep in line and "workspace = true" not in line:
-                        # Update the line
-                        if isinstance(dep_value, dict):
-                            # Check if it has a path (local mode) or just version (remote mode)
-                            if "path" in dep_value:
-                                # Local mode with path
-                                new_line = f'{actual_dep} = {{ version = "{dep_value["version"]}", path = "{dep_value["path"]}" }}\n'
-                            else:
-                                # Remote mode with just version
-                                new_line = f'{actual_dep} = "{dep_value["version"]}"\n'
-                        else:
-                            # Remote mode (simple string version)
-                            new_line = f'{actual_dep} = "{dep_value}"\n'
-
-                        updated_lines.append(new_line)
-                        line_updated = True
-                        break
-
-            if not line_updated:
-                updated_lines.append(line)
-
-        toml_path.write_text("".join(updated_lines))
+            # Check if we need to update this line
+            section_lines = new_lines.get(current_section)
+            dep_match = dep_line_re.match(line) if section_lines else None
+            if dep_match and "workspace = true" not in line:
+                line = section_lines.get(dep_match.group(1), line)
+
+            out.write(line)
+
+        new_content = out.getvalue()
+        if new_content == content:
+            return False
+
+        _atomic_write_text(toml_path, new_content)
+        with self._toml_cache_lock:
+            self._toml_cache.pop(Path(toml_path).resolve(), None)
+        return True
+
+    @staticmethod
+    def _format_dep_line(dep_name: str, dep_value) -> str:
+        """Render the Cargo.toml line that declares ``dep_name`` as ``dep_value``."""
+        if isinstance(dep_value, dict):
+            # Check if it has a path (local mode) or just version (remote mode)
+            if "path" in dep_value:
+                # Local mode with path
+                return f'{dep_name} = {{ version = "{dep_value["version"]}", path = "{dep_value["path"]}" }}\n'
+            # Remote mode with just version
+            return f'{dep_name} = "{dep_value["version"]}"\n'
+        # Remote mode (simple string version)
+        return f'{dep_name} = "{dep_value}"\n'
 
     def run_cargo_update(self) -> None:
         """Run cargo update to ensure lock file is in sync."""
         try:
-            subprocess.run(["cargo", "update"], check=True, capture_output=True)
+            # Re-resolving against the rewritten manifests doesn't need a fresh
+            # registry index; only go online if the local index can't satisfy
+            # them (e.g. a just-published crate in remote mode). Only stderr is
+            # kept, for the error report; stdout is discarded
+            try:
+                subprocess.run(
+                    ["cargo", "update", "--workspace", "--offline"],
+                    check=True,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            except subprocess.CalledProcessError:
+                subprocess.run(
+                    ["cargo", "update", "--workspace"],
+                    check=True,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                )
             print("✅ Cargo.lock updated")
         except subprocess.CalledProcessError as e:
+            stderr = e.stderr.decode(errors="replace").strip() if e.stderr else ""
+            suggestions = [
+                "Check if all dependencies are valid",
+                "Try running 'cargo check' to see detailed errors",
+                "Ensure you're in the project root directory"
+            ]
+            if stderr:
+                suggestions.insert(0, f"cargo reported: {stderr}")
             raise SmartError(
                 error="Failed to update Cargo.lock",
                 context="After changing dependency mode",
-                suggestions=[
-                    "Check if all dependencies are valid",
-                    "Try running 'cargo check' to see detailed errors",
-                    "Ensure you're in the project root directory"
-                ]
+                suggestions=suggestions
             )
 
     def switch_mode(self, target_mode: Optional[DependencyMode] = None) -> None:
@@ -341,8 +494,10 @@ class WorkspaceDepsManager:
         print(f"🔄 Switching to {target_mode.value} mode...")
 
         try:
-            self.update_workspace_dependencies(target_mode)
-            self.run_cargo_update()
+            if self.update_workspace_dependencies(target_mode):
+                self.run_cargo_update()
+            else:
+                print("✅ No Cargo.toml changes; skipping cargo update")
 
             print(f"✅ Successfully switched to {target_mode.value} mode")
 
@@ -1,31 +1,378 @@
 #!/bin/bash
 # Build script for Amalgam WASM bindings
+#
+# Builds the bundler, web and nodejs packages into crates/amalgam-wasm/pkg-*
+# concurrently. Run it from the repository root (the flake's build-wasm
+# command runs this same script with the pinned toolchain on PATH).
+#
+# Environment switches:
+#   WASM_OPT_LEVEL       wasm-opt level for every target, -O0..-O4, -Os or -Oz
+#                        (default: -Oz for bundler/web, -O3 for nodejs)
+#   WASM_OPT_CONVERGE    0 drops wasm-opt's --converge (default: 1)
+#   WASM_OPT_CACHE       0 disables the wasm-opt output cache (default: 1)
+#   WASM_OPT_CACHE_DIR   cache location (default: $XDG_CACHE_HOME/amalgam/wasm-opt)
+#   WASM_BINDGEN_DIRECT  1 builds with cargo + wasm-bindgen instead of wasm-pack;
+#                        no package.json is written (default: 0)
+#   WASM_PRECOMPRESS     0 skips the .gz/.br copies of bundler/web modules (default: 1)
+#   WASM_FORCE           1 rebuilds targets whose inputs haven't changed (default: 0)
+#   WASM_LOG_TAIL        log lines replayed per failed target (default: 40)
 
 set -e
 
+# Resolved before the cd below; the script's own hash is part of each
+# target's fingerprint
+script_path="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/$(basename "${BASH_SOURCE[0]}")"
+
 echo "Building Amalgam WASM bindings..."
 
+# Tool checks use the command -v builtin, so they cost a PATH lookup rather
+# than spawning each tool for its version
+if ! command -v cargo &> /dev/null; then
+    echo "cargo not found; install a Rust toolchain with the wasm32-unknown-unknown target" >&2
+    exit 1
+fi
+
 # Install wasm-pack if not already installed
 if ! command -v wasm-pack &> /dev/null; then
     echo "Installing wasm-pack..."
     curl https://rustwasm.github.io/wasm-pack/installer/init.sh -sSf | sh
 fi
 
+# Point every target at the workspace target dir so they reuse the same
+# compiled dependencies, and let sccache serve rustc when it's available
+export CARGO_TARGET_DIR="${CARGO_TARGET_DIR:-$(pwd)/target}"
+if [ -z "${RUSTC_WRAPPER:-}" ] && command -v sccache &> /dev/null; then
+    export RUSTC_WRAPPER=sccache
+fi
+
+# wasm-pack builds the release profile, where incremental artifacts only
+# bloat target/ and slow the build (sccache also skips incremental crates)
+export CARGO_INCREMENTAL="${CARGO_INCREMENTAL:-0}"
+
 # Build the WASM package
 cd crates/amalgam-wasm
 
-echo "Building for bundler target..."
-wasm-pack build --target bundler --out-dir pkg-bundler
+log_dir=$(mktemp -d)
+trap 'rm -rf "$log_dir"' EXIT
+
+# Features rustc enables by default for wasm32 that older wasm-opt releases
+# refuse to parse unless told about them
+WASM_OPT_FEATURES=(
+    --enable-simd
+    --enable-bulk-memory
+    --enable-nontrapping-float-to-int
+    --enable-sign-ext
+    --enable-reference-types
+    --enable-multivalue
+)
+
+# Optimize for size where the module is downloaded and for speed on node,
+# where startup matters more; WASM_OPT_LEVEL overrides both
+opt_level() {
+    if [ -n "${WASM_OPT_LEVEL:-}" ]; then
+        echo "$WASM_OPT_LEVEL"
+    elif [ "$1" = nodejs ]; then
+        echo -O3
+    else
+        echo -Oz
+    fi
+}
+
+case "${WASM_OPT_LEVEL:--Oz}" in
+    -O0|-O1|-O2|-O3|-O4|-Os|-Oz) ;;
+    *)
+        echo "Invalid WASM_OPT_LEVEL '$WASM_OPT_LEVEL' (expected -O0..-O4, -Os or -Oz)" >&2
+        exit 1
+        ;;
+esac
+
+# Cleanup passes run ahead of the size levels: drop debug info and the
+# producers section, then strip dead code and unused exports before -Os/-Oz
+# does its own inlining and folding
+WASM_OPT_SIZE_PASSES=(
+    --strip-debug
+    --strip-producers
+    --dce
+    --vacuum
+    --remove-unused-module-elements
+    --precompute-propagate
+)
+
+# Optimized modules are cached by a hash of the input and the exact
+# wasm-opt invocation, so an unchanged module is never re-optimized
+WASM_OPT_CACHE_DIR="${WASM_OPT_CACHE_DIR:-${XDG_CACHE_HOME:-$HOME/.cache}/amalgam/wasm-opt}"
+
+sha256() {
+    if command -v sha256sum &> /dev/null; then
+        sha256sum
+    else
+        shasum -a 256
+    fi | cut -d ' ' -f 1
+}
+
+# Probe wasm-opt's version once here rather than once per target
+if command -v wasm-opt &> /dev/null; then
+    WASM_OPT_VERSION_LINE=$(wasm-opt --version)
+    wasm_opt_version=$(grep -oE '[0-9]+' <<< "$WASM_OPT_VERSION_LINE" | head -n 1)
+    if [ "${wasm_opt_version:-0}" -lt 100 ]; then
+        echo "warning: wasm-opt version ${wasm_opt_version:-unknown} is old; consider upgrading binaryen"
+    fi
+fi
+
+# Stripping custom sections ahead of wasm-opt shrinks what it has to parse,
+# but target_features must survive: wasm-opt reads it to decide which
+# features the module uses. Only WABT releases with --keep-section qualify
+WASM_STRIP=()
+if command -v wasm-strip &> /dev/null \
+        && wasm-strip --help 2>&1 | grep -q -- --keep-section; then
+    WASM_STRIP=(wasm-strip --keep-section=target_features)
+fi
+
+# Run wasm-opt ourselves with the feature set spelled out
+optimize_wasm() {
+    local target=$1 wasm="$2/amalgam_wasm_bg.wasm" key cached
+    local level opt_args
+    level=$(opt_level "$target")
+    case "$level" in
+        -Os|-Oz) opt_args=("${WASM_OPT_SIZE_PASSES[@]}" "$level") ;;
+        *) opt_args=(--strip-debug --strip-producers "$level") ;;
+    esac
+    # Re-run the passes until the module stops shrinking; set
+    # WASM_OPT_CONVERGE=0 to trade that last bit of size for build time
+    if [ "${WASM_OPT_CONVERGE:-1}" != 0 ]; then
+        opt_args+=(--converge)
+    fi
+    if ! command -v wasm-opt &> /dev/null; then
+        echo "wasm-opt not found; leaving $wasm unoptimized"
+        return 0
+    fi
+
+    # wasm-opt's time grows with its input, so drop the names and producers
+    # sections it would strip anyway before it has to parse them
+    if [ ${#WASM_STRIP[@]} -ne 0 ]; then
+        local before
+        before=$(( $(wc -c < "$wasm") ))
+        "${WASM_STRIP[@]}" "$wasm"
+        echo "wasm-strip: $before -> $(( $(wc -c < "$wasm") )) bytes"
+    fi
+
+    key=$({ cat "$wasm"; printf '\0%s' "$WASM_OPT_VERSION_LINE" "${opt_args[@]}" "${WASM_OPT_FEATURES[@]}"; } | sha256)
+    cached="$WASM_OPT_CACHE_DIR/$key.wasm"
+    if [ "${WASM_OPT_CACHE:-1}" != 0 ] && [ -f "$cached" ]; then
+        cp "$cached" "$wasm.opt"
+        mv "$wasm.opt" "$wasm"
+        echo "reused cached wasm-opt ${opt_args[*]} output"
+        return 0
+    fi
+
+    # Write next to the input and rename over it: no backup copy is needed,
+    # since a failed run leaves the original untouched. As when binaryen is
+    # missing, the target then ships unoptimized rather than failing
+    if ! wasm-opt "${opt_args[@]}" "${WASM_OPT_FEATURES[@]}" "$wasm" -o "$wasm.opt"; then
+        rm -f "$wasm.opt"
+        echo "warning: wasm-opt failed; leaving $wasm unoptimized"
+        return 0
+    fi
+    mv "$wasm.opt" "$wasm"
+    echo "optimized with wasm-opt ${opt_args[*]} ${WASM_OPT_FEATURES[*]}"
 
-echo "Building for web target..."
-wasm-pack build --target web --out-dir pkg-web
+    # Publish via rename so concurrent targets never see a partial entry; a
+    # cache that can't be written only costs the next build some time
+    if [ "${WASM_OPT_CACHE:-1}" != 0 ]; then
+        mkdir -p "$WASM_OPT_CACHE_DIR" \
+            && cp "$wasm" "$cached.$BASHPID.tmp" \
+            && mv "$cached.$BASHPID.tmp" "$cached" \
+            || rm -f "$cached.$BASHPID.tmp"
+    fi
+}
 
-echo "Building for nodejs target..."
-wasm-pack build --target nodejs --out-dir pkg-node
+# Run one build step for a target: its output is appended to the target's
+# log, for the failure report, and shown with a target prefix
+run_step() {
+    local target=$1
+    shift
+    "$@" 2>&1 | tee -a "$log_dir/$target.log" | sed -u "s/^/[$target] /"
+}
+
+run_wasm_pack() {
+    local target=$1 out_dir=$2
+    shift 2
+    run_step "$target" wasm-pack build "$@" --target "$target" --out-dir "$out_dir"
+}
+
+# WASM_BINDGEN_DIRECT=1 builds with cargo and wasm-bindgen directly,
+# skipping wasm-pack's per-target startup and tool checks. It emits only the
+# module and bindings (no package.json), so it's meant for local iteration
+# rather than packages that get published
+if [ "${WASM_BINDGEN_DIRECT:-0}" != 0 ]; then
+    if ! command -v wasm-bindgen &> /dev/null; then
+        echo "WASM_BINDGEN_DIRECT needs wasm-bindgen-cli on PATH" >&2
+        exit 1
+    fi
+    # The CLI has to match the wasm-bindgen crate the module links against
+    bindgen_lock_version=$(grep -A 1 '^name = "wasm-bindgen"$' ../../Cargo.lock | sed -n 's/^version = "\(.*\)"$/\1/p')
+    bindgen_cli_version=$(wasm-bindgen --version | cut -d ' ' -f 2)
+    if [ "$bindgen_cli_version" != "$bindgen_lock_version" ]; then
+        echo "wasm-bindgen CLI $bindgen_cli_version doesn't match wasm-bindgen $bindgen_lock_version in Cargo.lock" >&2
+        exit 1
+    fi
+fi
+
+# Compile the crate once and generate one target's bindings from it; the
+# targets race for cargo's build lock, so only the first actually compiles
+run_bindgen_direct() {
+    local target=$1 out_dir=$2
+    run_step "$target" cargo build --release --lib --target wasm32-unknown-unknown \
+        && run_step "$target" wasm-bindgen --target "$target" --out-dir "$out_dir" \
+            "$CARGO_TARGET_DIR/wasm32-unknown-unknown/release/amalgam_wasm.wasm"
+}
+
+# Build one target, prefixing its output so the parallel logs stay readable
+compile_target() {
+    local target=$1 out_dir=$2 log="$log_dir/$1.log"
+
+    if [ "${WASM_BINDGEN_DIRECT:-0}" != 0 ]; then
+        run_bindgen_direct "$target" "$out_dir" && run_step "$target" optimize_wasm "$target" "$out_dir"
+        return
+    fi
+
+    # With binaryen installed, skip wasm-pack's single-level wasm-opt pass
+    # and optimize each target at its own level
+    if command -v wasm-opt &> /dev/null; then
+        run_wasm_pack "$target" "$out_dir" --no-opt && run_step "$target" optimize_wasm "$target" "$out_dir"
+        return
+    fi
+
+    if run_wasm_pack "$target" "$out_dir"; then
+        return 0
+    fi
+
+    # wasm-pack's bundled wasm-opt chokes on bulk-memory/SIMD encodings from
+    # newer rustc. Without binaryen on PATH there is no wasm-opt to retry
+    # with, so rebuild the target with --no-opt and ship it unoptimized
+    if ! grep -qE 'failed to execute .wasm-opt|Invalid reserved field|bulk memory|parse exception' "$log"; then
+        return 1
+    fi
+    echo "[$target] wasm-pack's bundled wasm-opt failed; rebuilding with --no-opt"
+    run_wasm_pack "$target" "$out_dir" --no-opt
+    echo "[$target] warning: $out_dir is unoptimized; install binaryen to run wasm-opt with explicit features"
+}
+
+# Everything the module is built from. Rather than mirroring amalgam-wasm's
+# path dependencies (which would drift as they change), take every crate in
+# the workspace, plus the workspace manifest, lockfile, cargo config and
+# toolchain pin
+WASM_INPUTS=()
+for input in .. ../../Cargo.toml ../../Cargo.lock ../../.cargo ../../rust-toolchain.toml ../../rust-toolchain; do
+    if [ -e "$input" ]; then
+        WASM_INPUTS+=("$input")
+    fi
+done
+
+# List the input files, skipping build outputs (the pkg-* dirs are written
+# by the concurrent targets themselves); extra find tests go before -print
+find_inputs() {
+    find "${WASM_INPUTS[@]}" \( -name 'pkg-*' -o -name target -o -name node_modules \) -prune \
+        -o -type f \( -name '*.rs' -o -name Cargo.toml -o -name Cargo.lock -o -name config.toml \
+            -o -name config -o -name 'rust-toolchain*' \) "$@" -print
+}
+
+# The script itself (pass lists, feature flags, build logic) and the
+# toolchain that compiles and optimizes the crate all shape the output;
+# versions rather than paths, so in-place upgrades are caught too
+script_hash=$(sha256 < "$script_path")
+rustc_version=$(rustc -vV 2> /dev/null || true)
+wasm_pack_version=$(wasm-pack --version 2> /dev/null || true)
+wasm_bindgen_version=$(wasm-bindgen --version 2> /dev/null || true)
+
+# The settings that shape a target's output plus its list of source files,
+# so renamed or deleted sources invalidate it as well as edited ones
+target_fingerprint() {
+    echo "opt=$(opt_level "$1") converge=${WASM_OPT_CONVERGE:-1} wasm-opt=$(command -v wasm-opt || true)" \
+        "bindgen-direct=${WASM_BINDGEN_DIRECT:-0} precompress=${WASM_PRECOMPRESS:-1}"
+    echo "script=$script_hash"
+    echo "$rustc_version"
+    echo "${WASM_OPT_VERSION_LINE:-}"
+    echo "$wasm_pack_version"
+    echo "$wasm_bindgen_version"
+    find_inputs | LC_ALL=C sort
+}
+
+# Write .gz and .br next to the module so static servers can send it
+# precompressed; only the browser-facing targets are served over HTTP.
+# WASM_PRECOMPRESS=0 turns this off
+precompress_wasm() {
+    local target=$1 wasm="$2/amalgam_wasm_bg.wasm"
+    if [ "${WASM_PRECOMPRESS:-1}" = 0 ] || [ "$target" = nodejs ]; then
+        rm -f "$wasm.gz" "$wasm.br"
+        return 0
+    fi
+    gzip -9 -n -c "$wasm" > "$wasm.gz"
+    if command -v brotli &> /dev/null; then
+        brotli -q 11 -f -o "$wasm.br" "$wasm"
+    else
+        echo "brotli not found; only writing $wasm.gz"
+    fi
+}
+
+# Skip wasm-pack entirely when the target's inputs haven't changed since its
+# last successful build; WASM_FORCE=1 rebuilds regardless
+build_target() {
+    local target=$1 out_dir=$2 stamp="$2/.amalgam_fingerprint" fingerprint
+    fingerprint=$(target_fingerprint "$target")
+    if [ "${WASM_FORCE:-0}" = 0 ] && [ -f "$out_dir/amalgam_wasm_bg.wasm" ] && [ -f "$stamp" ] \
+            && [ "$(cat "$stamp")" = "$fingerprint" ] \
+            && [ -z "$(find_inputs -newer "$stamp" | head -n 1)" ]; then
+        echo "[$target] up to date"
+        return 0
+    fi
+    rm -f "$stamp"
+    # Every step's output lands in the target's log, so a failure report
+    # shows the step that actually failed
+    set -o pipefail
+    : > "$log_dir/$target.log"
+    compile_target "$target" "$out_dir"
+    run_step "$target" precompress_wasm "$target" "$out_dir"
+    printf '%s\n' "$fingerprint" > "$stamp"
+}
+
+# The targets write to disjoint out-dirs, so build them concurrently; the
+# cargo compile is shared and only the bindgen/wasm-opt stages differ
+echo "Building bundler, web and nodejs targets..."
+pids=()
+targets=(bundler web nodejs)
+out_dirs=(pkg-bundler pkg-web pkg-node)
+for i in "${!targets[@]}"; do
+    build_target "${targets[$i]}" "${out_dirs[$i]}" &
+    pids+=($!)
+done
+
+failed=()
+for i in "${!pids[@]}"; do
+    if ! wait "${pids[$i]}"; then
+        failed+=("${targets[$i]}")
+    fi
+done
+
+if [ ${#failed[@]} -ne 0 ]; then
+    # The live output is interleaved across targets, so repeat the end of
+    # each failed target's log on its own
+    for target in "${failed[@]}"; do
+        echo "" >&2
+        echo "Last lines of the $target build:" >&2
+        tail -n "${WASM_LOG_TAIL:-40}" "$log_dir/$target.log" >&2
+    done
+    echo "WASM build failed for: ${failed[*]}" >&2
+    exit 1
+fi
 
 echo "WASM build complete!"
 echo ""
 echo "Packages created in:"
-echo "  - crates/amalgam-wasm/pkg-bundler (for webpack/rollup)"
-echo "  - crates/amalgam-wasm/pkg-web (for direct browser use)"
-echo "  - crates/amalgam-wasm/pkg-node (for Node.js)"
\ No newline at end of file
+descriptions=("for webpack/rollup" "for direct browser use" "for Node.js")
+for i in "${!out_dirs[@]}"; do
+    echo "  - crates/amalgam-wasm/${out_dirs[$i]} (${descriptions[$i]})"
+    # One directory listing per package gives every file's size, rather
+    # than a stat per expected file
+    ls -ln "${out_dirs[$i]}" | awk 'NR > 1 { printf "      %10d  %s\n", $5, $9 }'
+done